@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 # pylint: disable=multiple-imports
 """ACME client to met DNS challenge and receive TLS certificate"""
-import argparse, base64, binascii, configparser, copy, hashlib, json, logging
+import argparse, base64, configparser, copy, hashlib, json, logging
 import re, sys, subprocess, time
 import requests
 import dns.exception, dns.query, dns.name, dns.resolver, dns.rrset, dns.tsigkeyring, dns.update
 
+__all__ = ["get_crt", "main"]
+
 LOGGER = logging.getLogger('acme_dns_tiny')
-LOGGER.addHandler(logging.StreamHandler())
+if not LOGGER.handlers:  # don't stack handlers when the module is re-imported
+    LOGGER.addHandler(logging.StreamHandler())
+
+# Compiled once at import; matching the raw bytes of "openssl rsa -text" output
+# avoids decoding the whole dump just to find the modulus.
+MODULUS_RE = re.compile(rb"modulus:\s+?00:([a-f0-9:\s]+?)\r?\npublicExponent:\s*([0-9]+)",
+                        re.MULTILINE)
+# Single-pass deletion of the separators openssl puts inside the modulus dump
+MODULUS_STRIP = str.maketrans("", "", " \n\r:")
 
 
 def _base64(text):
@@ -163,20 +173,18 @@ def get_crt(config, log=LOGGER):
     log.info("Get private signature from account key.")
     accountkey = _openssl("rsa", ["-in", config["acmednstiny"]["AccountKeyFile"],
                                   "-noout", "-text"])
-    signature_search = re.search(r"modulus:\s+?00:([a-f0-9\:\s]+?)\r?\npublicExponent: ([0-9]+)",
-                                 accountkey.decode("utf8"), re.MULTILINE)
+    signature_search = MODULUS_RE.search(accountkey)
     if signature_search is None:
         raise ValueError("Unable to retrieve private signature.")
     pub_hex, pub_exp = signature_search.groups()
-    pub_exp = "{0:x}".format(int(pub_exp))
-    pub_exp = "0{0}".format(pub_exp) if len(pub_exp) % 2 else pub_exp
+    pub_exp = int(pub_exp)
     # That signature is used to authenticate with the ACME server, it needs to be safely kept
     private_acme_signature = {
         "alg": "RS256",
         "jwk": {
-            "e": _base64(binascii.unhexlify(pub_exp.encode("utf-8"))),
+            "e": _base64(pub_exp.to_bytes((pub_exp.bit_length() + 7) // 8, "big")),
             "kty": "RSA",
-            "n": _base64(binascii.unhexlify(re.sub(r"(\s|:)", "", pub_hex).encode("utf-8"))),
+            "n": _base64(bytes.fromhex(pub_hex.decode("ascii").translate(MODULUS_STRIP))),
         },
     }
     private_jwk = json.dumps(private_acme_signature["jwk"], sort_keys=True, separators=(",", ":"))
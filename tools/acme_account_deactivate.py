@@ -5,14 +5,17 @@ import argparse
 import subprocess
 import json
 import base64
-import binascii
-import re
 import copy
 import logging
 import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+
+__all__ = ["account_deactivate", "main"]
 
 LOGGER = logging.getLogger("acme_account_deactivate")
-LOGGER.addHandler(logging.StreamHandler())
+if not LOGGER.handlers:  # don't stack handlers when the module is re-imported
+    LOGGER.addHandler(logging.StreamHandler())
 
 
 def _b64(text):
@@ -20,6 +23,11 @@ def _b64(text):
     return base64.urlsafe_b64encode(text).decode("utf8").rstrip("=")
 
 
+def _int_to_bytes(value):
+    """Encodes a non-negative integer as big-endian bytes without leading zeroes."""
+    return value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
 def _openssl(command, options, communicate=None):
     """Run openssl command line and raise IOError on non-zero return."""
     with subprocess.Popen(["openssl", command] + options, stdin=subprocess.PIPE,
@@ -82,21 +90,18 @@ def account_deactivate(accountkeypath, acme_directory, timeout, log=LOGGER):
     acme_config = requests.get(acme_directory, headers=adtheaders, timeout=timeout).json()
 
     log.info("Get private signature from account key.")
-    accountkey = _openssl("rsa", ["-in", accountkeypath, "-noout", "-text"])
-    signature_search = re.search(r"modulus:\s+?00:([a-f0-9\:\s]+?)\r?\npublicExponent: ([0-9]+)",
-                                 accountkey.decode("utf8"), re.MULTILINE)
-    if signature_search is None:
-        raise ValueError("Unable to retrieve private signature.")
-    pub_hex, pub_exp = signature_search.groups()
-    pub_exp = "{0:x}".format(int(pub_exp))
-    pub_exp = "0{0}".format(pub_exp) if len(pub_exp) % 2 else pub_exp
+    with open(accountkeypath, "rb") as keyfile:
+        # The explicit backend keeps cryptography releases before 3.1 working,
+        # where it is a required argument; current releases still accept it.
+        account_key = serialization.load_pem_private_key(keyfile.read(), None, default_backend())
+    public_numbers = account_key.public_key().public_numbers()
     # That signature is used to authenticate with the ACME server, it needs to be safely kept
     private_acme_signature = {
         "alg": "RS256",
         "jwk": {
-            "e": _b64(binascii.unhexlify(pub_exp.encode("utf-8"))),
+            "e": _b64(_int_to_bytes(public_numbers.e)),
             "kty": "RSA",
-            "n": _b64(binascii.unhexlify(re.sub(r"(\s|:)", "", pub_hex).encode("utf-8"))),
+            "n": _b64(_int_to_bytes(public_numbers.n)),
         },
     }
 
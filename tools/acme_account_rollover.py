@@ -3,17 +3,35 @@
 """Tiny script to rollover two keys for an ACME account"""
 import sys
 import argparse
-import subprocess
 import json
 import base64
-import binascii
-import re
-import copy
+import hashlib
 import logging
 import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, utils
+
+__all__ = ["account_rollover", "main"]
+
+# One shared header dict for every signed POST; the User-Agent lives on the
+# session, so nothing else needs merging per call.
+JOSE_HEADERS = {'Content-Type': 'application/jose+json'}
 
 LOGGER = logging.getLogger("acme_account_rollover")
-LOGGER.addHandler(logging.StreamHandler())
+if not LOGGER.handlers:  # don't stack handlers when the module is re-imported
+    LOGGER.addHandler(logging.StreamHandler())
+
+try:
+    import orjson
+
+    def _dumps(obj):
+        """Serializes obj to compact JSON bytes (fast path: orjson)."""
+        return orjson.dumps(obj)  # pylint: disable=no-member
+except ImportError:
+    def _dumps(obj):
+        """Serializes obj to compact JSON bytes (fallback: stdlib json)."""
+        return json.dumps(obj, separators=(",", ":")).encode("ascii")
 
 
 def _b64(text):
@@ -21,133 +39,151 @@ def _b64(text):
     return base64.urlsafe_b64encode(text).decode("utf8").rstrip("=")
 
 
-def _openssl(command, options, communicate=None):
-    """Run openssl command line and raise IOError on non-zero return."""
-    with subprocess.Popen(["openssl", command] + options, stdin=subprocess.PIPE,
-                          stdout=subprocess.PIPE, stderr=subprocess.PIPE) as openssl:
-        out, err = openssl.communicate(communicate)
-        if openssl.returncode != 0:
-            raise IOError("OpenSSL Error: {0}".format(err))
-        return out
+def _b64b(data):
+    """Same base64 encoding as _b64, but stays in bytes for signing input."""
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _int_to_bytes(value):
+    """Encodes a non-negative integer as big-endian bytes without leading zeroes."""
+    return value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
+class AcmeKey:  # pylint: disable=too-few-public-methods
+    """Account key loaded once per run: the in-process private key, the JWK
+    derived from it and, once known, the account URL identifying it (kid)."""
+    def __init__(self, private_key, jwk, kid=None):
+        self.private_key = private_key
+        self.jwk = jwk
+        self.kid = kid
+
+
+def _load_acme_key(accountkeypath):
+    """Read a PEM account key and derive its signing material in one pass."""
+    with open(accountkeypath, "rb") as keyfile:
+        # The explicit backend keeps cryptography releases before 3.1 working,
+        # where it is a required argument; current releases still accept it.
+        private_key = serialization.load_pem_private_key(keyfile.read(), None, default_backend())
+    public_numbers = private_key.public_key().public_numbers()
+    return AcmeKey(private_key, {
+        "e": _b64(_int_to_bytes(public_numbers.e)),
+        "kty": "RSA",
+        "n": _b64(_int_to_bytes(public_numbers.n)),
+    })
+
+
+def _build_protected(key, url, nonce=None, use_jwk=False):
+    """Builds the JWS protected header for key, identified by its full JWK or
+    its account URL (kid); inner keyChange headers carry no nonce by design."""
+    protected = {"alg": "RS256", "url": url}
+    if use_jwk:
+        protected["jwk"] = key.jwk
+    else:
+        protected["kid"] = key.kid
+    if nonce is not None:
+        protected["nonce"] = nonce
+    return protected
 
 
 # pylint: disable=too-many-locals
 def account_rollover(old_accountkeypath, new_accountkeypath, acme_directory, timeout, log=LOGGER):
     """Rollover the old and new account key for an ACME account."""
-    def _get_private_acme_signature(accountkeypath):
-        """Read the account key to get the signature to authenticate with the ACME server."""
-        accountkey = _openssl("rsa", ["-in", accountkeypath, "-noout", "-text"])
-        signature_search = re.search(
-            r"modulus:\s+?00:([a-f0-9\:\s]+?)\r?\npublicExponent: ([0-9]+)",
-            accountkey.decode("utf8"), re.MULTILINE)
-        if signature_search is None:
-            raise ValueError("Unable to retrieve private signature.")
-        pub_hex, pub_exp = signature_search.groups()
-        pub_exp = "{0:x}".format(int(pub_exp))
-        pub_exp = "0{0}".format(pub_exp) if len(pub_exp) % 2 else pub_exp
-        return {
-            "alg": "RS256",
-            "jwk": {
-                "e": _b64(binascii.unhexlify(pub_exp.encode("utf-8"))),
-                "kty": "RSA",
-                "n": _b64(binascii.unhexlify(re.sub(r"(\s|:)", "", pub_hex).encode("utf-8"))),
-            },
-        }
-
-    def _sign_request(url, keypath, payload, is_inner=False):
+    def _sign_request(url, key, payload, is_inner=False):
         """Signs request with a specific right account key."""
-        nonlocal nonce
         if payload == "":  # on POST-as-GET, final payload has to be just empty string
-            payload64 = ""
-        else:
-            payload64 = _b64(json.dumps(payload).encode("utf8"))
-        if keypath == new_accountkeypath:
-            protected = copy.deepcopy(private_acme_new_signature)
-        elif keypath == old_accountkeypath:
-            protected = copy.deepcopy(private_acme_old_signature)
+            payload64 = b""
+        elif isinstance(payload, bytes):  # an already-serialized inner JWS
+            payload64 = _b64b(payload)
         else:
-            raise RuntimeError("Unknown keypath to sign request")
-
-        if is_inner or url == acme_config["newAccount"]:
-            if "kid" in protected:
-                del protected["kid"]
-        else:
-            del protected["jwk"]
-
-        if not is_inner:
-            protected["nonce"] = (nonce
-                                  or requests.get(
-                                      acme_config["newNonce"],
-                                      headers=adtheaders,
-                                      timeout=timeout)
-                                  .headers['Replay-Nonce'])
-        protected["url"] = url
-        protected64 = _b64(json.dumps(protected).encode("utf8"))
-        signature = _openssl("dgst", ["-sha256", "-sign", keypath],
-                             "{0}.{1}".format(protected64, payload64).encode("utf8"))
-        return {
-            "protected": protected64, "payload": payload64, "signature": _b64(signature)
-        }
-
-    def _send_signed_request(url, keypath, payload):
+            payload64 = _b64b(_dumps(payload))
+        protected = _build_protected(key, url, nonce=None if is_inner else nonce,
+                                     use_jwk=is_inner or url == acme_config["newAccount"])
+        protected64 = _b64b(_dumps(protected))
+        # Hash with hashlib (hardware SHA extensions when available) and hand
+        # the crypto layer only the digest to sign.
+        digest = hashlib.sha256(b".".join((protected64, payload64))).digest()
+        signature = key.private_key.sign(digest, padding.PKCS1v15(),
+                                         utils.Prehashed(hashes.SHA256()))
+        # The three fields are url-safe base64, so the envelope can be composed
+        # directly without another JSON encoder pass.
+        return (b'{"protected":"%s","payload":"%s","signature":"%s"}'
+                % (protected64, payload64, _b64b(signature)))
+
+    def _send_signed_request(url, key, payload):
         """Sends signed requests to ACME server."""
         nonlocal nonce
-        jose = _sign_request(url, keypath, payload)
-        joseheaders = {
-            'User-Agent': adtheaders.get('User-Agent'),
-            'Content-Type': 'application/jose+json'
-        }
+        jose = _sign_request(url, key, payload)
         try:
-            response = requests.post(url, json=jose, headers=joseheaders, timeout=timeout)
+            response = session.post(url, data=jose, headers=JOSE_HEADERS, timeout=timeout)
         except requests.exceptions.RequestException as error:
             response = error.response
         if response:
             nonce = response.headers['Replay-Nonce']
-            try:
-                return response, response.json()
-            except ValueError:  # if body is empty or not JSON formatted
-                return response, json.dumps({})
-        else:
-            raise RuntimeError("Unable to get response from ACME server.")
+            # An empty body is the normal outcome of a successful keyChange, so
+            # test for it instead of letting response.json() raise; a non-empty
+            # body can still be non-JSON (e.g. an error page from a proxy).
+            if response.content:
+                try:
+                    return response, response.json()
+                except ValueError:  # if body is not JSON formatted
+                    return response, {}
+            return response, {}
+        raise RuntimeError("Unable to get response from ACME server.")
 
     # main code
     adtheaders = {'User-Agent': 'acme-dns-tiny/3.0'}
     nonce = None
 
-    log.info("Fetch informations from the ACME directory.")
-    acme_config = requests.get(acme_directory, headers=adtheaders, timeout=timeout).json()
-
-    log.info("Get private signature from old account key.")
-    private_acme_old_signature = _get_private_acme_signature(old_accountkeypath)
-
-    log.info("Get private signature from new account key.")
-    private_acme_new_signature = _get_private_acme_signature(new_accountkeypath)
-
-    log.info("Ask to the ACME server the account identifier to complete the private signature.")
-    http_response, result = _send_signed_request(acme_config["newAccount"], old_accountkeypath, {
-        "onlyReturnExisting": True})
-    if http_response.status_code == 200:
-        private_acme_old_signature["kid"] = http_response.headers["Location"]
-        private_acme_new_signature["kid"] = http_response.headers["Location"]
-    else:
-        raise ValueError("Error looking or account URL: {0} {1}"
-                         .format(http_response.status_code, result))
-
-    log.info("Rolling over account keys.")
-    # The signature by the new key covers the account URL and the old key,
-    # signifying a request by the new key holder to take over the account from
-    # the old key holder.
-    inner_payload = _sign_request(acme_config["keyChange"], new_accountkeypath, {
-        "account": private_acme_old_signature["kid"],
-        "oldKey": private_acme_old_signature["jwk"]}, is_inner=True)
-    # The signature by the old key covers this request and its signature, and
-    # indicates the old key holder's assent to the roll-over request.
-    http_response, result = _send_signed_request(acme_config["keyChange"], old_accountkeypath,
-                                                 inner_payload)
-
-    if http_response.status_code != 200:
-        raise ValueError("Error rolling over account key: {0} {1}"
-                         .format(http_response.status_code, result))
+    # Reuse a single session so every call below shares one pooled TLS
+    # connection instead of paying a new handshake per request.
+    session = requests.Session()
+    session.headers.update(adtheaders)
+    # Mount on the scheme: adapters are matched by URL prefix and the other
+    # ACME endpoints don't have to live under the directory URL.
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    with session:
+        log.info("Fetch informations from the ACME directory.")
+        acme_config = session.get(acme_directory, timeout=timeout).json()
+
+        # Prefetch the first anti-replay nonce while we are still reading keys,
+        # instead of spending an extra round trip just before the first signed
+        # request. HEAD is the RFC 8555 method for newNonce (no response body).
+        nonce = session.head(acme_config["newNonce"], timeout=timeout).headers['Replay-Nonce']
+
+        log.info("Get private signature from old account key.")
+        old_key = _load_acme_key(old_accountkeypath)
+
+        log.info("Get private signature from new account key.")
+        new_key = _load_acme_key(new_accountkeypath)
+
+        log.info("Ask to the ACME server the account identifier to complete the private "
+                 "signature.")
+        http_response, result = _send_signed_request(
+            acme_config["newAccount"], old_key, {"onlyReturnExisting": True})
+        if http_response.status_code == 200:
+            kid = http_response.headers["Location"]
+            old_key.kid = kid
+            new_key.kid = kid
+        else:
+            raise ValueError("Error looking or account URL: {0} {1}"
+                             .format(http_response.status_code, result))
+
+        log.info("Rolling over account keys.")
+        # The signature by the new key covers the account URL and the old key,
+        # signifying a request by the new key holder to take over the account from
+        # the old key holder.
+        inner_payload = _sign_request(acme_config["keyChange"], new_key, {
+            "account": kid,
+            "oldKey": old_key.jwk}, is_inner=True)
+        # The signature by the old key covers this request and its signature, and
+        # indicates the old key holder's assent to the roll-over request.
+        http_response, result = _send_signed_request(acme_config["keyChange"], old_key,
+                                                     inner_payload)
+
+        if http_response.status_code != 200:
+            raise ValueError("Error rolling over account key: {0} {1}"
+                             .format(http_response.status_code, result))
     log.info("Keys rolled over.")
 
 